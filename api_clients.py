@@ -0,0 +1,71 @@
+# Copyright 2024 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Google API client access.
+
+Contains the methods for building the Google API discovery clients and
+reusing them across requests.
+"""
+
+import functools
+import threading
+from flask import g, session
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+import orjson
+from fs_storage import get_value_session
+
+
+def get_credentials_json() -> str:
+  """Gets the stored credentials of the current session.
+
+  The credentials are read from the session storage once per request.
+
+  Returns:
+    The user credentials in JSON format.
+  """
+  if 'credentials_json' not in g:
+    g.credentials_json = get_value_session(session['session_id'],
+                                           'credentials')
+  return g.credentials_json
+
+
+def get_service(creds_json: str, service_name: str, version: str) -> any:
+  """Gets a Google API client, building it only on the first request.
+
+  Clients are cached on the stored credentials rather than the session ID so
+  that a session which signs in again gets a client with its new credentials.
+  Each thread gets its own client as the underlying httplib2 connection is not
+  thread safe.
+
+  Args:
+    creds_json: The user credentials in JSON format from the session storage.
+    service_name: The name of the Google API, e.g. 'sheets'.
+    version: The version of the Google API, e.g. 'v4'.
+
+  Returns:
+    The Google API client resource.
+  """
+  return _build_service(creds_json, service_name, version,
+                        threading.get_ident())
+
+
+@functools.lru_cache(maxsize=128)
+def _build_service(creds_json: str, service_name: str, version: str,
+                   thread_id: int) -> any:
+  """Builds a Google API client for a thread, see get_service."""
+  creds = Credentials.from_authorized_user_info(orjson.loads(creds_json))
+  return build(service_name, version, credentials=creds,
+               static_discovery=True)
+
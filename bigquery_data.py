@@ -17,12 +17,35 @@
 Contains the methods for accessing daya in BigQuery
 """
 
-import json
+import functools
 import logging
+import orjson
 from google.cloud import bigquery
+from google.cloud import bigquery_storage
 from google.oauth2.credentials import Credentials
-from flask import session
-from fs_storage import get_value_session
+from api_clients import get_credentials_json
+
+
+@functools.lru_cache(maxsize=128)
+def _get_bq_clients(creds_json: str) -> tuple[
+  bigquery.Client, bigquery_storage.BigQueryReadClient]:
+  """Gets the BigQuery clients for a login, reusing them across requests.
+
+  Clients are cached on the stored credentials so that signing in again, for
+  example to grant the BigQuery scope, gets clients with the new credentials.
+
+  Args:
+    creds_json: The user credentials in JSON format from the session storage.
+
+  Returns:
+    The BigQuery client and BigQuery Storage read client as a tuple.
+
+  Raises:
+    ValueError: If the stored credentials are missing or invalid.
+  """
+  creds = Credentials.from_authorized_user_info(orjson.loads(creds_json))
+  return (bigquery.Client(credentials=creds),
+          bigquery_storage.BigQueryReadClient(credentials=creds))
 
 
 def _get_raw_bq_data(bq_full_location) -> dict:
@@ -34,25 +57,17 @@ def _get_raw_bq_data(bq_full_location) -> dict:
 
   Returns:
     The BigQuery data in a dictionary format
-  """
-    try:
-      creds_info = json.loads(get_value_session(
-      session['session_id'], 'credentials'))
-    except ValueError as e:
-      logging.exception(e)
-
-    creds = Credentials.from_authorized_user_info(creds_info)
 
-    client = bigquery.Client(credentials=creds)
+  Raises:
+    ValueError: If the session credentials are missing or invalid.
+  """
     query = f"""
 select * from `{bq_full_location}` LIMIT 10000
 """
-    query_job = client.query(query)
-    final_bq_data = []
-    for row in query_job:
-        formatted_row = {}
-        for key in row.keys():
-            formatted_row[key] = row[key]
-            final_bq_data.append(formatted_row)
-
-    return final_bq_data
\ No newline at end of file
+    try:
+      client, bqstorage_client = _get_bq_clients(get_credentials_json())
+    except ValueError as e:
+      logging.exception(e)
+      raise
+    rows = client.query_and_wait(query)
+    return rows.to_arrow(bqstorage_client=bqstorage_client).to_pylist()
@@ -18,13 +18,22 @@ Contains all the Causal Impact methods for creating a Causal Impact
 report, summary and charts.
 """
 
+from concurrent import futures
+import html
+import io
 import re
+import threading
 import causalimpact
+import numpy as np
 from google.cloud import storage
-from matplotlib.colors import LinearSegmentedColormap
 from project_secrets import get_secret
 
-_TEMP_FOLDER = "/tmp/"
+_STORAGE_CLIENT = storage.Client()
+_MATRIX_GREEN = np.array([0, 128 / 255, 0])
+_MULTISPACE = re.compile(r"  +")
+# Only one report per worker fits its models at a time. This keeps memory
+# within the instance limit now that each worker serves several threads.
+_FIT_LOCK = threading.Lock()
 
 
 def get_causal_impact_object(
@@ -46,8 +55,31 @@ def get_causal_impact_object(
   )
 
 
+def get_causal_impact_objects(fits: list, credibility: float) -> list:
+  """Gets the Causal Impact objects for several independent models at once.
+
+  The models are fitted concurrently in threads as TensorFlow releases the
+  GIL while sampling, which avoids copying the data and fitted models between
+  processes. Requests in the same worker wait for each other's fits.
+
+  Args:
+    fits: List of (df, pre_period, post_period) tuples, one for each model.
+    credibility: The confidence level the models need to run with.
+
+  Returns:
+    The causal impact objects in the same order as the fits.
+  """
+  with _FIT_LOCK, futures.ThreadPoolExecutor(
+      max_workers=len(fits)) as executor:
+    return list(executor.map(
+      lambda fit: get_causal_impact_object(*fit, credibility), fits))
+
+
 def get_causal_impact_summary(impact: list, credibility: float) -> list:
-  """Creates a summary text of the created Causal Impact model.
+  """Creates a summary table of the created Causal Impact model.
+
+  The rows mirror the lines of causalimpact.summary(output_format="summary"),
+  split into columns, but are read straight from the impact summary data.
 
   Args:
     impact: The Casual Impact object from the created model.
@@ -56,26 +88,57 @@ def get_causal_impact_summary(impact: list, credibility: float) -> list:
   Returns:
     The modelled data output as a list.
   """
-  summary = causalimpact.summary(impact, output_format="summary", alpha=credibility)
-  summary = re.sub("  +", "|", summary)
-  output = [r.split("|") for r in [r for r in summary.split("\n")]]
-  if len(output[4]) == 2:
-    tmp_ = output[4][1].split(")", 1)
-    output[4][1] = tmp_[0] + ")"
-    output[4].append(tmp_[1])
-  if len(output[5]) == 2:
-    tmp_ = output[5][1].split("]", 1)
-    output[5][1] = tmp_[0] + "]"
-    output[5].append(tmp_[1])
-  if len(output[7]) == 2:
-    tmp_ = output[7][1].split(")", 1)
-    output[7][1] = tmp_[0] + ")"
-    output[7].append(tmp_[1])
-  if len(output[8]) == 2:
-    tmp_ = output[8][1].split("]", 1)
-    output[8][1] = tmp_[0] + "]"
-    output[8].append(tmp_[1])
-  return output
+  average = impact.summary.loc["average"]
+  cumulative = impact.summary.loc["cumulative"]
+  p_value = float(impact.summary["p_value"].iloc[0])
+  ci = str((1 - credibility) * 100).rstrip("0").rstrip(".") + "% CI"
+
+  def _num(value, digits=1) -> str:
+    return str(round(float(value), digits))
+
+  def _interval(row, name) -> str:
+    return f"[{_num(row[name + '_lower'])}, {_num(row[name + '_upper'])}]"
+
+  def _abs_interval(row) -> str:
+    bounds = sorted([round(float(row["abs_effect_lower"]), 1),
+                     round(float(row["abs_effect_upper"]), 1)])
+    return f"[{bounds[0]}, {bounds[1]}]"
+
+  def _rel_interval(row) -> str:
+    bounds = sorted([float(row["rel_effect_lower"]),
+                     float(row["rel_effect_upper"])])
+    return f"[{bounds[0]:.1%}, {bounds[1]:.1%}]"
+
+  return [
+    [""],
+    ["Posterior Inference {CausalImpact}"],
+    ["", "Average", "Cumulative"],
+    ["Actual", _num(average["actual"]), _num(cumulative["actual"])],
+    ["Prediction (s.d.)",
+     f"{_num(average['predicted'])} ({_num(average['predicted_sd'], 2)})",
+     f"{_num(cumulative['predicted'])} "
+     f"({_num(cumulative['predicted_sd'], 2)})"],
+    [ci, _interval(average, "predicted"), _interval(cumulative, "predicted")],
+    [""],
+    ["Absolute effect (s.d.)",
+     f"{_num(average['abs_effect'])} ({_num(average['abs_effect_sd'], 2)})",
+     f"{_num(cumulative['abs_effect'])} "
+     f"({_num(cumulative['abs_effect_sd'], 2)})"],
+    [ci, _abs_interval(average), _abs_interval(cumulative)],
+    [""],
+    ["Relative effect (s.d.)",
+     f"{float(average['rel_effect']):.1%} "
+     f"({float(average['rel_effect_sd']):.1%})",
+     f"{float(cumulative['rel_effect']):.1%} "
+     f"({round(float(cumulative['rel_effect_sd']), 2):.1%})"],
+    [ci, _rel_interval(average), _rel_interval(cumulative)],
+    [""],
+    [f"Posterior tail-area probability p: {round(p_value, 3)}"],
+    [f"Posterior prob. of a causal effect: {1 - p_value:.2%}"],
+    [""],
+    ['For more details run the command: '
+     'summary(impact, output_format="report")'],
+  ]
 
 
 def get_causal_impact_chart(impact, div="vis", store_img=False, image_name="") -> str:
@@ -91,14 +154,29 @@ def get_causal_impact_chart(impact, div="vis", store_img=False, image_name="") -
     The HTML output of the Casual Impact charts.
   """
   ci = causalimpact.plot(impact, static_plot=False, chart_width=800)
-  if store_img:
-    ci.save(_TEMP_FOLDER + image_name, engine="vl-convert")
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(get_secret("image_bucket"))
-    blob = bucket.blob(image_name)
-    blob.cache_control = "private"
-    blob.upload_from_filename(_TEMP_FOLDER + image_name)
-  return ci.to_html().replace("vis", div)
+  if not store_img:
+    return ci.to_html().replace("vis", div)
+  with futures.ThreadPoolExecutor(max_workers=1) as executor:
+    upload = executor.submit(_store_chart_image, ci, image_name)
+    chart_html = ci.to_html()
+    upload.result()
+  return chart_html.replace("vis", div)
+
+
+def _store_chart_image(ci, image_name: str):
+  """Renders the chart as a PNG and uploads it to the image bucket.
+
+  Args:
+    ci: The Altair chart of the Causal Impact model.
+    image_name: The unique ID for the image name to be stored in GCP.
+  """
+  image = io.BytesIO()
+  ci.save(image, format="png", engine="vl-convert")
+  bucket = _STORAGE_CLIENT.bucket(get_secret("image_bucket"))
+  blob = bucket.blob(image_name)
+  blob.cache_control = "private"
+  blob.upload_from_string(image.getvalue(), content_type="image/png",
+                          timeout=30)
 
 
 def get_causal_impact_report(impact, credibility: float) -> str:
@@ -117,21 +195,52 @@ def get_causal_impact_report(impact, credibility: float) -> str:
 def get_df_matrix(df) -> str:
   """Gets a matrix output of the covariates and target event.
 
+  Cells are shaded from green to white, the same colours the pandas Styler
+  background_gradient(low=1, high=0) gave, but built directly as HTML.
+
   Args:
     df: The data for the model in dataframe format.
 
   Returns:
     The matrix table in string format.
   """
-  df_matrix = df[df.columns[0:9]].corr(method="pearson", numeric_only=False)
-  df_matrix = df_matrix.abs()
-  segments = [(0, "green"), (1, "white")]
-  cmap = LinearSegmentedColormap.from_list("", segments)
-  df_matrix = df_matrix.style.background_gradient(
-    cmap=cmap, low=1, high=0, axis=None)
+  columns = df.columns[0:9]
+  values = df[columns].to_numpy(dtype=np.float64)
+  if np.isnan(values).any():
+    matrix = df[columns].corr(method="pearson", numeric_only=False)
+    matrix = matrix.to_numpy(dtype=np.float64)
+  else:
+    matrix = np.corrcoef(values, rowvar=False)
+  matrix = np.abs(np.atleast_2d(matrix))
 
-  return df_matrix.to_html().replace(
-    "<table", '<table class="bordered-table opp"')
+  smin, smax = np.nanmin(matrix), np.nanmax(matrix)
+  vmin = smin - (smax - smin)
+  if smax > vmin:
+    norm = (matrix - vmin) / (smax - vmin)
+  else:
+    norm = np.zeros_like(matrix)
+  shade = np.clip(np.floor(np.nan_to_num(norm) * 256), 0, 255) / 255
+  rgb = _MATRIX_GREEN + (1 - _MATRIX_GREEN) * shade[..., np.newaxis]
+  rgb[np.isnan(matrix)] = 0
+  hex_rgb = np.round(rgb * 255).astype(int)
+  linear = np.where(rgb <= 0.04045, rgb / 12.92,
+                    ((rgb + 0.055) / 1.055) ** 2.4)
+  dark = linear @ np.array([0.2126, 0.7152, 0.0722]) < 0.408
+
+  rows = []
+  for i, name in enumerate(columns):
+    cells = "".join(
+      f'<td style="background-color: #{r:02x}{g:02x}{b:02x}; '
+      f'color: {"#f1f1f1" if dark[i, j] else "#000000"};">'
+      f"{matrix[i, j]:.6f}</td>"
+      for j, (r, g, b) in enumerate(hex_rgb[i]))
+    rows.append(f"<tr><th>{html.escape(str(name))}</th>{cells}</tr>")
+  header = "".join(f"<th>{html.escape(str(name))}</th>" for name in columns)
+  return (
+    '<table class="bordered-table opp">'
+    f"<thead><tr><th></th>{header}</tr></thead>"
+    f"<tbody>{''.join(rows)}</tbody></table>"
+  )
 
 
 def get_validation(df) -> list:
@@ -145,5 +254,5 @@ def get_validation(df) -> list:
     The data validation table.
   """
   validation = str(df.describe())
-  validation = re.sub("  +", "|", validation)
+  validation = _MULTISPACE.sub("|", validation)
   return [r.split("|") for r in [r for r in validation.split("\n")]]
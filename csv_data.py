@@ -19,6 +19,7 @@ the metrics and dimensions.
 """
 
 import csv
+import datetime as dt
 from datetime import datetime
 import logging
 import pandas as pd
@@ -34,13 +35,9 @@ def get_csv_data(file) -> dict:
     The data from the CSV data as a dictionary.
   """
   try:
-    fstring = file.read().decode("utf8")
-    return [
-      {k: v.replace(",", "") for k, v in row.items()}
-      for row in csv.DictReader(
-        fstring.splitlines(), skipinitialspace=True, quoting=csv.QUOTE_ALL
-      )
-    ]
+    df = pd.read_csv(file, encoding="utf8", thousands=",",
+                     skipinitialspace=True, quoting=csv.QUOTE_ALL)
+    return df.to_dict(orient="records")
   except ValueError as e:
     logging.exception(e)
     err = {"error": f"Error: {e}"}
@@ -53,29 +50,51 @@ def get_csv_columns_by_type(data: dict) -> tuple[list, str, list]:
   the numerical columns and the text based columns.
 
   Args:
-    data: The raw CSV data from the file upload or reading of the Google sheet.
+    data: The raw CSV data from the file upload or reading of the Google sheet,
+    as a list of rows or a dataframe.
 
   Returns:
     List of dates, list of numerical columns and list of text based columns as
     a Tuple.
   """
-  keys_list = list(data[0].keys())
-  date_column = ""
+  df = pd.DataFrame(data)
+  keys_list = list(df.columns)
+  date_column = next((key for key in keys_list if "date" in key.lower()), "")
+  numeric_columns = []
   string_columns = []
   for key in keys_list:
-    if "date" in key.lower():
-      date_column = key
-      keys_list.remove(key)
-      break
-  for rows in data:
-    for key in keys_list:
-      if key != date_column:
-        if rows.get(key) == "":
-          rows.update({key: "0"})
-        if not str(rows.get(key)).replace(".", "").isnumeric():
-          string_columns.append(key)
-          keys_list.remove(key)
-  return keys_list, date_column, string_columns
+    if key == date_column:
+      continue
+    if _is_numeric_column(df[key]):
+      numeric_columns.append(key)
+    else:
+      string_columns.append(key)
+  return numeric_columns, date_column, string_columns
+
+
+def _is_numeric_column(column: pd.Series) -> bool:
+  """Checks if a column only holds numbers, or text that parses as numbers.
+
+  Booleans and dates are not counted as numbers, even though pandas can
+  convert them.
+
+  Args:
+    column: The column values to check.
+
+  Returns:
+    True if the column can be used as a metric.
+  """
+  if (pd.api.types.is_bool_dtype(column)
+      or pd.api.types.is_datetime64_any_dtype(column)
+      or pd.api.types.is_timedelta64_dtype(column)):
+    return False
+  if pd.api.types.is_numeric_dtype(column):
+    return True
+  if column.map(
+      lambda v: isinstance(v, (bool, dt.date, dt.time, dt.timedelta))).any():
+    return False
+  values = pd.to_numeric(column.replace("", "0"), errors="coerce")
+  return bool((values.notna() | column.isna()).all())
 
 
 def csv_get_date_range(data: dict, date_column: str,
@@ -91,16 +110,10 @@ def csv_get_date_range(data: dict, date_column: str,
   Returns:
     Returns the minimum and maximum date.
   """
-  date_list = []
-  for item in data:
-    if date_column in item:
-      if convert:
-        date_obj = datetime.strptime(item[date_column], "%b %d %Y")
-        item_to_add = date_obj.strftime("%Y-%m-%d")
-      else:
-        item_to_add = item[date_column]
-      date_list.append(item_to_add)
-  return str(min(date_list)), str(max(date_list))
+  dates = pd.DataFrame(data, columns=[date_column])[date_column].dropna()
+  if convert:
+    dates = pd.to_datetime(dates, format="%b %d %Y").dt.strftime("%Y-%m-%d")
+  return str(dates.min()), str(dates.max())
 
 
 def csv_merge_data(csv_data: dict, csv_settings: dict, raw_data: dict, pre_tag: str) -> dict:
@@ -113,27 +126,22 @@ def csv_merge_data(csv_data: dict, csv_settings: dict, raw_data: dict, pre_tag:
     event date, target event etc.).
     raw_data: The overall raw data from other datasources to be merged with the
     CSV/sheet data.
+    pre_tag: The prefix added to the merged metric names.
 
   Returns:
-      The raw data with all CSV/sheet data merged.
+      The raw data with all CSV/sheet data merged. Dates missing from either
+      source have NaN for that source's metrics.
   """
-  for item in csv_data:
-    if item[csv_settings["date_column"]] in raw_data:
-      for col in csv_settings["metrics"]:
-        raw_data[item[csv_settings["date_column"]]].update(
-          {f"{pre_tag}_{col}": item[col]}
-        )
-    else:
-      for col in csv_settings["metrics"]:
-        if item[csv_settings["date_column"]] in raw_data:
-          raw_data[item[csv_settings["date_column"]]].update(
-            {f"{pre_tag}_{col}": item[col]}
-          )
-        else:
-          raw_data[item[csv_settings["date_column"]]] = {
-            f"{pre_tag}_{col}": item[col]
-          }
-  return raw_data
+  date_column = csv_settings["date_column"]
+  metrics = csv_settings["metrics"]
+  df_csv = (
+    pd.DataFrame(csv_data, columns=[date_column] + metrics)
+    .drop_duplicates(date_column, keep="last")
+    .set_index(date_column)
+    .add_prefix(f"{pre_tag}_")
+  )
+  df_raw = pd.DataFrame.from_dict(raw_data, orient="index")
+  return df_raw.join(df_csv, how="outer").to_dict(orient="index")
 
 
 def get_date_from_str(date) -> str:
@@ -38,11 +38,26 @@ def get_value_session(session_id: str, name: str) -> any:
   Returns:
     The session value.
   """
-  cs_ref = db.collection(SESSION_NAME).document(session_id)
-  if cs_ref.get().exists:
-    if name in cs_ref.get().to_dict():
-      return cs_ref.get().to_dict()[name]
+  snapshot = db.collection(SESSION_NAME).document(session_id).get()
+  if not snapshot.exists:
     return None
+  return snapshot.to_dict().get(name)
+
+
+def get_values_session(session_id: str, names: list) -> dict:
+  """Gets several values stored in the session with a single read.
+
+  Args:
+    session_id: The ID of the session for the user.
+    names: The names of the session values to return.
+
+  Returns:
+    Dictionary of the session values by name, with None for missing values.
+  """
+  snapshot = db.collection(SESSION_NAME).document(session_id).get(
+    field_paths=names)
+  values = snapshot.to_dict() if snapshot.exists else {}
+  return {name: values.get(name) for name in names}
 
 
 def set_value_session(session_id: str, name: str, value: any):
@@ -58,6 +73,18 @@ def set_value_session(session_id: str, name: str, value: any):
                'last_updated': firestore.SERVER_TIMESTAMP}, merge=True)
 
 
+def set_values_session(session_id: str, values: dict):
+  """Sets several name-value pairs into the session storage in one write.
+
+  Args:
+    session_id: The ID of the session for the user.
+    values: The session names and the values to store in them.
+  """
+  doc_ref = db.collection(SESSION_NAME).document(session_id)
+  doc_ref.set({**values, 'last_updated': firestore.SERVER_TIMESTAMP},
+              merge=True)
+
+
 def delete_field(session_id: str, field: str):
   """Deletes a session field from the session storage.
 
@@ -12,52 +12,49 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from datetime import datetime
-import json
-from flask import session
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from fs_storage import get_value_session
+from api_clients import get_credentials_json, get_service
 
 
 def get_analytics_client():
-  creds_info = json.loads(get_value_session(session['session_id'], 'credentials'))
-  return build('analyticsdata', 'v1beta', credentials=Credentials.from_authorized_user_info(creds_info))
+  return get_service(get_credentials_json(), 'analyticsdata', 'v1beta')
 
 
 def get_analytics_admin_client():
-  print(session['session_id'])
-  creds_info = json.loads(get_value_session(session['session_id'], 'credentials'))
-  return build('analyticsadmin', 'v1beta', credentials=Credentials.from_authorized_user_info(creds_info))
+  return get_service(get_credentials_json(), 'analyticsadmin', 'v1beta')
+
+
+# The maximum page size of the Admin API list methods.
+_PAGE_SIZE = 200
+
+
+def _list_all(collection, items_key: str, **kwargs) -> list:
+  request = collection.list(pageSize=_PAGE_SIZE, **kwargs)
+  items = []
+  while request is not None:
+    response = request.execute()
+    items.extend(response.get(items_key, []))
+    request = collection.list_next(request, response)
+  return items
 
 
 def get_ga4_account_ids() -> list:
   analytics_admin = get_analytics_admin_client()
-  response = analytics_admin.accounts().list().execute()
-  account_id_list = []
-  if 'accounts' not in response:
+  accounts = _list_all(analytics_admin.accounts(), 'accounts')
+  if not accounts:
     return [["-- No accounts --", "-- No accounts --"]]
-  for account in response['accounts']:
-    account_id_list.append(
-        [((account['name']).split('/'))[1], account['displayName']]
-    )
-  return account_id_list
+  return [
+      [account['name'].rpartition('/')[2], account['displayName']]
+      for account in accounts
+  ]
 
 
 def get_ga4_property_ids(account_id: str) -> list:
   analytics_admin = get_analytics_admin_client()
-  response = (
-      analytics_admin.properties()
-      .list(filter='parent:accounts/' + account_id)
-      .execute()
-  )
-  property_id_list = []
-  for properties in response['properties']:
-    property_id_list.append(
-        [((properties['name']).split('/'))[1], properties['displayName']]
-    )
-
-  return property_id_list
+  return [
+      [properties['name'].rpartition('/')[2], properties['displayName']]
+      for properties in _list_all(analytics_admin.properties(), 'properties',
+                                  filter='parent:accounts/' + account_id)
+  ]
 
 
 def get_ga4_data(property_id: str, date_from: str, date_to: str, items: list, raw_data: dict) -> dict:
@@ -82,14 +79,11 @@ def get_ga4_data(property_id: str, date_from: str, date_to: str, items: list, ra
     for metHeaders in report.get('metricHeaders', []):
       headers.append(metHeaders.get('name'))
     for row in report.get('rows', []):
-      for date in row.get('dimensionValues'):
-        date = datetime.strptime(date.get('value'), '%Y%m%d').strftime(
-            '%Y-%m-%d'
-        )
-      for idx, val in enumerate(row.get('metricValues')):
-        if date in raw_data:
-          raw_data[date].update({f'ga4_{headers[idx]}': val.get('value')})
-        else:
-          raw_data[date] = {f'ga4_{headers[idx]}': val.get('value')}
+      date = row['dimensionValues'][0]['value']
+      date = f'{date[0:4]}-{date[4:6]}-{date[6:8]}'
+      raw_data.setdefault(date, {}).update({
+          f'ga4_{headers[idx]}': val.get('value')
+          for idx, val in enumerate(row.get('metricValues'))
+      })
 
   return raw_data
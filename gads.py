@@ -12,28 +12,45 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
+from concurrent import futures
+import functools
 import textwrap
-from flask import session
 from google.ads.googleads.client import GoogleAdsClient
-from fs_storage import get_value_session
+from api_clients import get_credentials_json
 import logging
+import orjson
+import pandas as pd
 from project_secrets import get_secret
 
 API_VERSION ='v16'
+_MAX_STREAMS = 8
+_GADS_COLUMNS = [
+    "date",
+    "gads_impressions",
+    "gads_clicks",
+    "gads_video_views",
+    "gads_cost_micros",
+    "gads_conversions",
+    "gads_view_through_conversions",
+]
 
 def get_gads_client(mcc_id: str) -> GoogleAdsClient:
     try:
-        main_creds = json.loads(get_value_session(session['session_id'], 'credentials'))
+        return _load_gads_client(get_credentials_json(), mcc_id)
     except ValueError as e:
         logging.exception(e)
         return f"Error: Session Expired"
+
+
+@functools.lru_cache(maxsize=64)
+def _load_gads_client(creds_json: str, mcc_id: str) -> GoogleAdsClient:
+    main_creds = orjson.loads(creds_json)
     creds = {
             "developer_token": get_secret("developer_token"),
             "refresh_token": main_creds["refresh_token"],
             "client_id": main_creds["client_id"],
             "client_secret": main_creds["client_secret"],
-            "use_proto_plus": True,
+            "use_proto_plus": False,
         }
 
     google_ads_client = GoogleAdsClient.load_from_dict(creds)
@@ -42,12 +59,22 @@ def get_gads_client(mcc_id: str) -> GoogleAdsClient:
     return google_ads_client
 
 
-def get_gads_data(mcc_id: str, customer_id: str, campaign_ids: list, date_from: str, date_to: str) -> dict:
+def get_gads_service(mcc_id: str):
     try:
-        client = get_gads_client(mcc_id)
-        ga_service = client.get_service("GoogleAdsService", version=API_VERSION)
+        return _load_gads_service(get_credentials_json(), mcc_id)
     except ValueError as e:
-        return "Error: Session expired"
+        logging.exception(e)
+        return "Error: Session Expired"
+
+
+@functools.lru_cache(maxsize=64)
+def _load_gads_service(creds_json: str, mcc_id: str):
+    return _load_gads_client(creds_json, mcc_id).get_service(
+        "GoogleAdsService", version=API_VERSION)
+
+
+def get_gads_data(mcc_id: str, customer_id: str, campaign_ids: list, date_from: str, date_to: str) -> dict:
+    ga_service = get_gads_service(mcc_id)
     camp_filter = ""
     if not customer_id + "-0" in campaign_ids[0]:
         camp_filter = "AND campaign.id IN (" + (",").join(campaign_ids) + ")"
@@ -61,142 +88,42 @@ def get_gads_data(mcc_id: str, customer_id: str, campaign_ids: list, date_from:
     response.service_reference = ga_service
     return response
 
-def process_gads_responses(responses, metrics: list):
-  final_d = {}
-  counter = 0
-  for response in responses:
-    for batch in response:
-      for row in batch.results:
-        if row.segments.date in final_d:
-          counter += 1
-          final_d[row.segments.date].update(
-              {
-                  "gads_impressions": (
-                      final_d[row.segments.date]["gads_impressions"]
-                      + row.metrics.impressions
-                  )
-              }
-          )
-          final_d[row.segments.date].update(
-              {
-                  "gads_clicks": (
-                      final_d[row.segments.date]["gads_clicks"]
-                      + row.metrics.clicks
-                  )
-              }
-          )
-          final_d[row.segments.date].update(
-              {
-                  "gads_video_views": (
-                      final_d[row.segments.date]["gads_video_views"]
-                      + row.metrics.video_views
-                  )
-              }
-          )
-          final_d[row.segments.date].update(
-              {
-                  "gads_cost_micros": (
-                      final_d[row.segments.date]["gads_cost_micros"]
-                      + row.metrics.cost_micros
-                  )
-              }
-          )
-          final_d[row.segments.date].update(
-              {
-                  "gads_conversions": (
-                      final_d[row.segments.date]["gads_conversions"]
-                      + row.metrics.conversions
-                  )
-              }
-          )
-          final_d[row.segments.date].update(
-              {
-                  "gads_view_through_conversions": (
-                      final_d[row.segments.date][
-                          "gads_view_through_conversions"
-                      ]
-                      + row.metrics.view_through_conversions
-                  )
-              }
-          )
-          final_d[row.segments.date].update(
-              {
-                  "gads_ctr": (
-                      final_d[row.segments.date]["gads_clicks"]
-                      + row.metrics.clicks
-                      and (
-                          final_d[row.segments.date]["gads_clicks"]
-                          + row.metrics.clicks
-                      )
-                      / (
-                          final_d[row.segments.date]["gads_impressions"]
-                          + row.metrics.impressions
-                      )
-                      or 0
-                  )
-              }
-          )
-          final_d[row.segments.date].update(
-              {
-                  "gads_average_cpc": (
-                      final_d[row.segments.date]["gads_clicks"]
-                      + row.metrics.clicks
-                      and (
-                          final_d[row.segments.date]["gads_cost_micros"]
-                          + row.metrics.cost_micros
-                      )
-                      / (
-                          final_d[row.segments.date]["gads_clicks"]
-                          + row.metrics.clicks
-                      )
-                      or 0
-                  )
-              }
-          )
-          final_d[row.segments.date].update(
-              {
-                  "gads_average_cost": (
-                      final_d[row.segments.date]["gads_cost_micros"]
-                      and (
-                          final_d[row.segments.date]["gads_cost_micros"]
-                          + row.metrics.cost_micros
-                      )
-                      / counter
-                      or 0
-                  )
-              }
-          )
-        else:
-          final_d[row.segments.date] = {
-              "gads_impressions": row.metrics.impressions,
-              "gads_clicks": row.metrics.clicks,
-              "gads_video_views": row.metrics.video_views,
-              "gads_cost_micros": row.metrics.cost_micros,
-              "gads_conversions": row.metrics.conversions,
-              "gads_view_through_conversions": (
-                  row.metrics.view_through_conversions
-              ),
-              "gads_ctr": (
-                  row.metrics.impressions
-                  and row.metrics.clicks / row.metrics.impressions
-                  or 0
-              ),
-              "gads_average_cpc": (
-                  row.metrics.clicks
-                  and row.metrics.cost_micros / row.metrics.clicks
-                  or 0
-              ),
-              "gads_average_cost": row.metrics.cost_micros,
-          }
+def _collect_rows(response) -> list:
+  rows = []
+  for batch in response:
+    for row in batch.results:
+      m = row.metrics
+      rows.append((
+          row.segments.date,
+          m.impressions,
+          m.clicks,
+          m.video_views,
+          m.cost_micros,
+          m.conversions,
+          m.view_through_conversions,
+      ))
+  return rows
 
-  for key in final_d:
-    for metric in final_d[key].copy():
-      if not metric[5 : len(metric)] in metrics:
-        final_d[key].pop(metric)
-  return final_d
+def process_gads_responses(responses, metrics: list):
+  # Drain the streams concurrently so one customer's results are received
+  # while another's are being unpacked.
+  with futures.ThreadPoolExecutor(max_workers=_MAX_STREAMS) as executor:
+    rows = [row for rows in executor.map(_collect_rows, responses)
+            for row in rows]
+
+  grouped = pd.DataFrame.from_records(rows, columns=_GADS_COLUMNS).groupby(
+      "date", sort=True)
+  final_df = grouped.sum()
+  final_df["gads_ctr"] = final_df["gads_clicks"].div(
+      final_df["gads_impressions"]).where(final_df["gads_impressions"] > 0, 0)
+  final_df["gads_average_cpc"] = final_df["gads_cost_micros"].div(
+      final_df["gads_clicks"]).where(final_df["gads_clicks"] > 0, 0)
+  final_df["gads_average_cost"] = grouped["gads_cost_micros"].mean()
+
+  final_df = final_df[[c for c in final_df.columns if c[5:] in metrics]]
+  return final_df.to_dict(orient="index")
 
 def get_gads_campaigns(mcc_id: str, customer_id: str) -> list:
-  client = get_gads_client(mcc_id)
   campaigns = []
   query = textwrap.dedent("""
     SELECT
@@ -205,7 +132,7 @@ def get_gads_campaigns(mcc_id: str, customer_id: str) -> list:
     FROM campaign
     """)
   try:
-    ga_service = client.get_service("GoogleAdsService", version=API_VERSION)
+    ga_service = get_gads_service(mcc_id)
     response = ga_service.search(customer_id=customer_id, query=query)
   except:
      campaigns.append(["No campaigns in account", 0])
@@ -219,7 +146,6 @@ def get_gads_campaigns(mcc_id: str, customer_id: str) -> list:
 
 
 def get_gads_customer_ids(mcc_id: str) -> list:
-  client = get_gads_client(mcc_id)
   all_customer_ids = []
   query = textwrap.dedent("""
     SELECT
@@ -229,7 +155,7 @@ def get_gads_customer_ids(mcc_id: str) -> list:
     WHERE customer_client.level <= 1 AND customer_client.manager = FALSE
     """)
 
-  ga_service = client.get_service("GoogleAdsService", version=API_VERSION)
+  ga_service = get_gads_service(mcc_id)
   try:
     response = ga_service.search(customer_id=mcc_id, query=query)
   except ValueError as e:
@@ -247,12 +173,10 @@ def get_gads_customer_ids(mcc_id: str) -> list:
 
 def get_gads_mcc_ids() -> list:
   client = get_gads_client("")
-  all_mcc_ids = []
   customer_service = client.get_service("CustomerService")
 
   accessible_customers = customer_service.list_accessible_customers()
-  resource_names = accessible_customers.resource_names
-  for resource_name in resource_names:
-    all_mcc_ids.append(resource_name.split("/")[1])
-
-  return all_mcc_ids
+  return [
+      resource_name.rpartition("/")[2]
+      for resource_name in accessible_customers.resource_names
+  ]
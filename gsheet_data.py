@@ -18,16 +18,13 @@ Contains the methods for accessing Google Sheets, extracting the data,
 metircs and dimensions.
 """
 
-import json
 import logging
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from flask import session
-from fs_storage import get_value_session
+import pandas as pd
+from api_clients import get_credentials_json, get_service
 
 
-def get_raw_gsheet_data(sheet_id, sheet_name='', gid=0) -> tuple[
-  list, list, str]:
+def get_raw_gsheet_data(sheet_id, sheet_name='', gid=0,
+                        list_sheets=True) -> tuple[pd.DataFrame, list, str]:
   """Gets the raw data from the Google sheets specified by the user.
 
   Args:
@@ -35,27 +32,32 @@ def get_raw_gsheet_data(sheet_id, sheet_name='', gid=0) -> tuple[
     sheet_name: The name of the specific tab to use, if specified.
     gid: Alternative to sheet name, if the user provides a tab ID (gid) in the
     URL.
+    list_sheets: Whether to look up the names of all tabs in the sheet. When
+    false, the tab list is empty unless the gid has to be looked up.
 
   Returns:
-    The raw sheet data, a list of all tabs in the sheet and the tab being used.
+    The raw sheet data as a dataframe, a list of all tabs in the sheet and the
+    tab being used. On error, a list of 'error' and the message is returned in
+    place of the dataframe.
   """
   sheet_err = ['error']
   try:
-    creds_info = json.loads(get_value_session(
-      session['session_id'], 'credentials'))
+    service = get_service(get_credentials_json(), 'sheets', 'v4')
   except ValueError as e:
     logging.exception(e)
     sheet_err.append(
       f'Sheet does not exist or is invalid - Make sure the \
         tab \'{sheet_name}\' exists'
     )
-    return sheet_err, 'error'
+    return sheet_err, 'error', ''
 
-  creds = Credentials.from_authorized_user_info(creds_info)
-  service = build('sheets', 'v4', credentials=creds)
   # Call the Sheets API
   sheet = service.spreadsheets()
-  sheets = sheet.get(spreadsheetId=sheet_id).execute().get('sheets', [])
+  sheets = []
+  if list_sheets or (not sheet_name and gid > 0):
+    sheets = sheet.get(
+      spreadsheetId=sheet_id, fields='sheets.properties(sheetId,title)'
+    ).execute().get('sheets', [])
   sheet_names = [sheet['properties']['title'] for sheet in sheets]
   if sheet_name:
     sheet_range = f"'{sheet_name}'!A:ZZ"
@@ -70,23 +72,20 @@ def get_raw_gsheet_data(sheet_id, sheet_name='', gid=0) -> tuple[
     sheet_name = ''
     sheet_range = 'A:ZZ'
   try:
+    # Unformatted values return numbers without thousands separators, while
+    # dates are kept as the strings shown in the sheet.
     result = sheet.values().get(spreadsheetId=sheet_id,
-                      range=sheet_range).execute()
+                      range=sheet_range,
+                      valueRenderOption='UNFORMATTED_VALUE',
+                      dateTimeRenderOption='FORMATTED_STRING').execute()
     values = result.get('values', [])
-    final_gsheet = []
-    headers = values.pop(0)
-    header_count = len(headers)
-    for row in values:
-      temp_data = {}
-      row_add = header_count - len(row)
-      if row_add != 0:
-        for x in range(row_add):
-          row.append('0')
-      for inx, item in enumerate(headers):
-        if row[inx] == '':
-          row[inx] = '0'
-        temp_data[item] = row[inx].replace(',', '')
-      final_gsheet.append(temp_data)
+    headers = [str(header) for header in values[0]]
+    final_gsheet = pd.DataFrame(
+      [row[:len(headers)] for row in values[1:]], columns=headers)
+    # Repeated headers keep the last column, as the per-row dicts used to.
+    final_gsheet = final_gsheet.loc[
+      :, ~final_gsheet.columns.duplicated(keep='last')]
+    final_gsheet = final_gsheet.fillna('0').replace('', '0')
   except Exception as e:
     logging.exception(e)
     sheet_err.append(
@@ -19,20 +19,21 @@ Analytics. Information can be augmented by uploading a CSV file.
 """
 
 from datetime import datetime, timedelta
+import functools
 import json
 import os
 import socket
 import struct
 import math
 import logging
-import numpy as np
+import orjson
 import pandas as pd
 import re
 from google_auth_oauthlib.flow import Flow
 from uuid import uuid4
 from causal import (
   get_causal_impact_chart,
-  get_causal_impact_object,
+  get_causal_impact_objects,
   get_causal_impact_report,
   get_causal_impact_summary,
   get_validation,
@@ -54,7 +55,13 @@ from flask import (
   session,
 )
 from bigquery_data import _get_raw_bq_data
-from fs_storage import set_value_session, get_value_session, delete_field
+from fs_storage import (
+  delete_field,
+  get_value_session,
+  get_values_session,
+  set_value_session,
+  set_values_session,
+)
 from gsheet_data import get_raw_gsheet_data
 from slides_api import create_slide
 from project_secrets import get_secret
@@ -70,6 +77,7 @@ app.secret_key = get_secret('flask_secret_key')
 PROJECT_ID = '' #can set for local testing
 
 
+@functools.lru_cache(maxsize=32)
 def is_loopback(host) -> bool:
   """Localhost check.
 
@@ -90,8 +98,8 @@ def is_loopback(host) -> bool:
       r = socket.getaddrinfo(host, None, family, socket.SOCK_STREAM)
     except socket.gaierror:
       return False
-    for family, _, _, _, sockaddr in r:
-      if not loopback_checker[family](sockaddr[0]):
+    for addr_family, _, _, _, sockaddr in r:
+      if not loopback_checker[addr_family](sockaddr[0]):
         return False
   return True
 
@@ -124,8 +132,12 @@ SCOPES = [
     'https://www.googleapis.com/auth/bigquery'
 ]
 
-flow: Flow
 csv_data = {}
+_DATE_PATTERN = re.compile(r'([0-9]{4})-([0-9]{2})-([0-9]{2})')
+_P_VALUE_PATTERN = re.compile(r'p:\s+([0-9]+\.[0-9]+)')
+_NON_NUMERIC_PATTERN = re.compile(r'[^\d\-.]')
+_SLIDE_TEMPLATE = os.environ.get('SLIDE_TEMPLATE', '')
+_AUTH_FLAGS = ['credentials', 'analytics', 'adwords', 'sheets', 'slides']
 
 
 @app.route('/favicon.ico')
@@ -258,24 +270,16 @@ def root() -> render_template:
   Returns:
     The main page application.
   """
-  creds = get_value_session(get_session_id(), 'credentials')
-  analytics = get_value_session(get_session_id(), 'analytics')
-  adwords = get_value_session(get_session_id(), 'adwords')
-  sheets = get_value_session(get_session_id(), 'sheets')
-  slides = get_value_session(get_session_id(), 'slides')
-  authed = 'true' if creds else 'false'
-  auth_analytics = 'true' if analytics else 'false'
-  auth_adwords = 'true' if adwords else 'false'
-  auth_sheets = 'true' if sheets else 'false'
-  auth_slides = 'true' if slides else 'false'
+  session_values = get_values_session(get_session_id(), _AUTH_FLAGS)
+  auth_flags = {
+    f'auth_{name}': 'true' if session_values[name] else 'false'
+    for name in _AUTH_FLAGS
+  }
+  auth_flags['authed'] = auth_flags.pop('auth_credentials')
 
   return render_template(
     'index.html',
-    authed=authed,
-    auth_analytics=auth_analytics,
-    auth_adwords=auth_adwords,
-    auth_sheets=auth_sheets,
-    auth_slides=auth_slides,
+    **auth_flags,
     bq_name=os.environ.get('bq_DATASOURCE'),
   )
 
@@ -305,21 +309,23 @@ def oauth_complete() -> redirect:
     code = request.args.get('code', 0, type=str)
     scope = request.args.get('scope', 0, type=str)
 
+    session_values = {}
     if 'analytics' in scope:
-      set_value_session(get_session_id(), 'analytics', 'true')
+      session_values['analytics'] = 'true'
     if 'adwords' in scope:
-      set_value_session(get_session_id(), 'adwords', 'true')
+      session_values['adwords'] = 'true'
     if 'spreadsheets' in scope:
-      set_value_session(get_session_id(), 'sheets', 'true')
+      session_values['sheets'] = 'true'
     if 'presentations' in scope:
-      set_value_session(get_session_id(), 'slides', 'true')
+      session_values['slides'] = 'true'
 
     scope = scope.split(' ')
     flow = create_flow(scope)
     flow.fetch_token(code=code)
     credentials = flow.credentials
 
-    set_value_session(get_session_id(), 'credentials', credentials.to_json())
+    session_values['credentials'] = credentials.to_json()
+    set_values_session(get_session_id(), session_values)
   return redirect('/')
 
 
@@ -333,11 +339,15 @@ def report() -> render_template:
     The report template with all the data for the report page.
   """
   auth_slides = 'false'
-  slides = get_value_session(get_session_id(), 'slides')
-  if slides:
+  session_id = get_session_id()
+  session_values = get_values_session(
+    session_id,
+    ['slides', 'sheet_id', 'gs_tab', 'bq_full_location', 'image_name'],
+  )
+  if session_values['slides']:
     auth_slides = 'true'
   if request.form.get('data_to_send') and check_session_id():
-    data = json.loads(request.form.get('data_to_send', 0, type=str))
+    data = orjson.loads(request.form.get('data_to_send', 0, type=str))
 
     raw_data = {}
     gads_responses = []
@@ -372,42 +382,46 @@ def report() -> render_template:
     if 'csv' in data:
       if data['csv_format'] == 'gsheet':
         csv_data = get_raw_gsheet_data(
-          get_value_session(get_session_id(), 'sheet_id'),
-          get_value_session(get_session_id(), 'gs_tab'),
+          session_values['sheet_id'],
+          session_values['gs_tab'],
+          list_sheets=False,
         )[0]
       else:
-        csv_data = get_value_session(get_session_id(), 'csv_data')
+        csv_data = get_value_session(session_id, 'csv_data')
       raw_data = csv_merge_data(csv_data, data['csv'], raw_data, 'csv')
 
     if 'bq' in data:
-      bq_data = _get_raw_bq_data(
-        get_value_session(get_session_id(), 'bq_full_location'))
+      try:
+        bq_data = _get_raw_bq_data(session_values['bq_full_location'])
+      except ValueError:
+        session.clear()
+        return redirect('sessionExpired')
       raw_data = csv_merge_data(bq_data, data['bq'], raw_data, 'bq')
 
     if raw_data:
-      df = pd.DataFrame.from_dict(raw_data).transpose()
+      df = pd.DataFrame.from_dict(raw_data, orient='index')
       if data['target_event'] in df.columns:
-        df.replace(np.NaN, 0, inplace=True)
-        df.replace('', 0, inplace=True)
-        df.index = pd.DatetimeIndex(df.index)
+        text_columns = df.select_dtypes(exclude='number').columns
+        df[text_columns] = df[text_columns].apply(pd.to_numeric)
+        df = df.fillna(0)
+        df.index = pd.to_datetime(df.index, format='ISO8601')
         df = df.sort_index()
-        df = df.apply(pd.to_numeric)
-        df = df[
-          [data['target_event']]
-          + [c for c in df if c not in [data['target_event']]]
-        ]  # Puts target event as first column
+        df = _move_to_front(df, data['target_event'])
 
-        if 0 in df.values:
+        if (df.to_numpy() == 0).any():
           warnings = (
             'Some values have 0 in them which are from your data or where dates'
             ' were missing and were filled in automatically'
           )
 
         try:
-          from_d = df.index.get_loc(data['from_date'])
-          to_d = df.index.get_loc(data['to_date'])
-          event_d = df.index.get_loc(data['event_date'])
-        except KeyError:
+          positions = df.index.get_indexer(pd.to_datetime(
+            [data['from_date'], data['to_date'], data['event_date']],
+            format='ISO8601',
+          )).tolist()
+        except ValueError:
+          positions = [-1]
+        if min(positions) < 0:
           return render_template(
             'error.html',
             error_msg='One of your selected dates does not exist \
@@ -415,12 +429,27 @@ def report() -> render_template:
             monthly etc.), you must select a date that exists in your dataset',
           )
 
+        from_d, to_d, event_d = positions
         pre_period = [from_d, event_d - 1]
         post_period = [event_d, to_d]
+        fits = [(df, pre_period, post_period)]
+
+        pre_delta = event_d - from_d
+        run_v1 = pre_delta > 4 and data['pre_period_validation']
+        if run_v1:
+          v1_quarter = math.floor(pre_delta / 4)
+
+          v1_pre_period = [from_d, from_d + (v1_quarter * 3) - 1]
+          v1_post_period = [from_d + (v1_quarter * 3), event_d - 1]
+          fits.append((df, v1_pre_period, v1_post_period))
+
+        if data['unaffectedness_validation']:
+          v2_df = _move_to_front(
+            df, data['unaffectedness_option'], drop=data['target_event'])
+          fits.append((v2_df, pre_period, post_period))
+
         try:
-          impact = get_causal_impact_object(
-            df, pre_period, post_period, credibility
-          )
+          impacts = get_causal_impact_objects(fits, credibility)
         except ValueError as e:
           logging.exception(e)
           return render_template(
@@ -429,11 +458,12 @@ def report() -> render_template:
               Impact charts. Please try again.',
           )
 
+        impact = impacts[0]
         org_summary = get_causal_impact_summary(impact, credibility)
-        image_name = get_value_session(get_session_id(), 'image_name')
+        image_name = session_values['image_name']
         if not image_name:
           image_name = str(uuid4()) + '.png'
-        set_value_session(get_session_id(), 'image_name', image_name)
+          set_value_session(session_id, 'image_name', image_name)
         org_chart = get_causal_impact_chart(
           impact=impact, store_img=True, image_name=image_name
         )
@@ -443,8 +473,7 @@ def report() -> render_template:
         org_report = get_causal_impact_report(impact, credibility)
         org_cov = (', ').join(df.columns[1:])
 
-        dfhtml = df.to_html().replace('<th>',
-                    '<th class="full-table-border">').replace('<tr>', '<tr class="full-table-border">')
+        dfhtml = df.to_html(classes='raw-data-table')
         df_val = get_validation(df)
 
         # Matrix Validation (v3)
@@ -455,16 +484,8 @@ def report() -> render_template:
         # Pre-Period validation (v1)
         v1_validation_chart = '-'
         v1_summary = ''
-        pre_delta = event_d - from_d
-        if pre_delta > 4 and data['pre_period_validation']:
-          v1_quarter = math.floor(pre_delta / 4)
-
-          v1_pre_period = [from_d, from_d + (v1_quarter * 3) - 1]
-          v1_post_period = [from_d + (v1_quarter * 3), event_d - 1]
-
-          impact = get_causal_impact_object(
-            df, v1_pre_period, v1_post_period, credibility
-          )
+        if run_v1:
+          impact = impacts[1]
           v1_validation_chart = get_causal_impact_chart(
             impact=impact, div='vis_v1'
           )
@@ -475,23 +496,15 @@ def report() -> render_template:
         v2_summary = ''
 
         if data['unaffectedness_validation']:
-          df = df[
-            [data['unaffectedness_option']]
-            + [c for c in df if c not in [data['unaffectedness_option']]]
-          ]
-          df.drop(data['target_event'], axis=1, inplace=True)
-
-          impact = get_causal_impact_object(
-            df, pre_period, post_period, credibility
-          )
+          impact = impacts[-1]
           v2_validation_chart = get_causal_impact_chart(
             impact=impact, div='vis_v2'
           )
           v2_summary = get_causal_impact_summary(impact, credibility)
 
-        pval = re.search(r'p:\s+([0-9]+\.[0-9]+)', org_summary[13][0])
+        pval = _P_VALUE_PATTERN.search(org_summary[13][0])
 
-        delete_field(get_session_id(), 'output_data')
+        delete_field(session_id, 'output_data')
         if len(org_summary[7]) == 3:
           tot_inc = org_summary[7][2].split(' ')[0]
         else:
@@ -507,7 +520,7 @@ def report() -> render_template:
         unaff_test=''
         main_abs_eff = float(org_summary[7][2].strip().split(' ')[0])
         main_ci = [
-          float(re.sub(r'[^\d\-.]', '', x))
+          float(_NON_NUMERIC_PATTERN.sub('', x))
           for x in org_summary[8][2].strip('[]').split(',')
         ]
 
@@ -527,7 +540,7 @@ def report() -> render_template:
             pre_abs_eff = float((v1_summary[7][2].strip().split(' ')[0]))
           if len(v1_summary[8]) > 2:
             pre_ci = [
-              float(re.sub(r'[^\d\-.]', '', x))
+              float(_NON_NUMERIC_PATTERN.sub('', x))
               for x in v1_summary[8][2].strip('[]').split(',')
             ]
           if (pre_ci[1] > 0 and pre_abs_eff <= 0) or \
@@ -562,7 +575,7 @@ def report() -> render_template:
             unaff_abs_eff = float((v2_summary[7][2].strip().split(' ')[0]))
           if len(v2_summary[8]) > 2:
             unaff_ci = [
-              float(re.sub(r'[^\d\-.]', '', x))
+              float(_NON_NUMERIC_PATTERN.sub('', x))
               for x in v2_summary[8][2].strip('[]').split(',')
             ]
           if (unaff_ci[1] > 0 and unaff_abs_eff <= 0) or \
@@ -631,11 +644,7 @@ def report() -> render_template:
           'pre_test': pre_test,
           'unaff_test': main_test
         }
-        set_value_session(get_session_id(), 'output_data', output_data)
-
-        slide_temp = ''
-        if 'SLIDE_TEMPLATE' in os.environ:
-          slide_temp = os.environ.get('SLIDE_TEMPLATE')
+        set_value_session(session_id, 'output_data', output_data)
 
         return render_template(
           'report.html',
@@ -650,7 +659,7 @@ def report() -> render_template:
           v2_validation_chart=v2_validation_chart,
           v2_summary=v2_summary,
           v3_matrix=v3_matrix,
-          slide_template=slide_temp,
+          slide_template=_SLIDE_TEMPLATE,
           auth_slides=auth_slides,
           lift=lift,
           total_score=total_score,
@@ -743,12 +752,14 @@ def _get_gs_data() -> jsonify:
   gid = request.args.get('gid', 0, type=int)
   if 'https://' in sheet_id:
     sheet_id = sheet_id.split('/')[5]
-  set_value_session(get_session_id(), 'sheet_id', sheet_id)
 
   final_gsheet, sheets, sheet_name = get_raw_gsheet_data(sheet_id, gs_tab, gid)
-  set_value_session(get_session_id(), 'gs_tab', sheet_name)
+  set_values_session(get_session_id(),
+                     {'sheet_id': sheet_id, 'gs_tab': sheet_name})
 
-  if len(final_gsheet) == 0:
+  if isinstance(final_gsheet, list):
+    return jsonify(result=final_gsheet)
+  elif len(final_gsheet) == 0:
     res = []
     res.append('error')
     res.append(
@@ -758,14 +769,12 @@ def _get_gs_data() -> jsonify:
     res.append('sheets')
     res.append(sheets)
     return jsonify(result=res)
-  elif final_gsheet[0] != 'error':
+  else:
     res = _get_csv_settings(final_gsheet, 'gsheet')
     res.append('sheets')
     res.append(sheets)
     res.append(sheet_name)
     return jsonify(result=res)
-  else:
-    return jsonify(result=final_gsheet)
 
 
 def _get_csv_settings(csv_data: dict, format: str) -> dict:
@@ -884,6 +893,25 @@ def _get_bq_settings(bq_data: dict) -> dict:
       )
   return bq_settings
 
+def _move_to_front(df: pd.DataFrame, column: str,
+                   drop: str = None) -> pd.DataFrame:
+  """Moves a column to the front, as Causal Impact models the first column.
+
+  Args:
+    df: The dataframe to reorder.
+    column: The name of the column to put first.
+    drop: The name of a column to leave out, if any.
+
+  Returns:
+    The dataframe with the column first and the rest in their original order.
+  """
+  columns = df.columns.tolist()
+  columns.remove(column)
+  if drop is not None:
+    columns.remove(drop)
+  return df[[column, *columns]]
+
+
 def _validate_date(date_text: str) -> bool:
   """Validates that a string is in the correct date format.
 
@@ -893,10 +921,11 @@ def _validate_date(date_text: str) -> bool:
   Returns:
     Boolean of 'true' if the date format is valid and 'false' if it is not.
   """
+  match = _DATE_PATTERN.fullmatch(date_text)
+  if not match:
+    return False
   try:
-    if date_text != datetime.strptime(date_text,
-          '%Y-%m-%d').strftime('%Y-%m-%d'):
-      raise ValueError
+    datetime(*map(int, match.groups()))
     return True
   except ValueError:
     return False
@@ -911,12 +940,16 @@ def create_flow(scope) -> Flow:
   Returns:
     Flow object with all the relevant scopes and approvals.
   """
-  client_config = json.loads(get_secret('client_secret'))
-  global flow
-  flow = Flow.from_client_config(client_config=client_config, scopes=scope)
+  flow = Flow.from_client_config(
+    client_config=_get_client_config(), scopes=scope)
   flow.redirect_uri = _REDIRECT_URI
   return flow
 
 
+@functools.lru_cache(maxsize=1)
+def _get_client_config() -> dict:
+  return json.loads(get_secret('client_secret'))
+
+
 if __name__ == '__main__':
   app.run(host='127.0.0.1', port=8080, debug=True)
@@ -20,12 +20,9 @@ output details and charts to them.
 
 import datetime
 import re
-import json
 import os
 import logging
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from flask import session
+from api_clients import get_credentials_json, get_service
 from fs_storage import get_value_session
 from project_secrets import get_secret
 
@@ -51,13 +48,12 @@ def create_slide(
     Slide ID for the new copy of the slide.
   """
   try:
-    creds_info = json.loads(get_value_session(
-      session['session_id'], 'credentials'))
+    creds_json = get_credentials_json()
+    slides_service = get_service(creds_json, 'slides', 'v1')
+    drive_service = get_service(creds_json, 'drive', 'v3')
   except ValueError as e:
     logging.exception(e)
-  creds = Credentials.from_authorized_user_info(creds_info)
-  slides_service = build('slides', 'v1', credentials=creds)
-  drive_service = build('drive', 'v3', credentials=creds)
+    return '0'
 
   body = {'name': f'{client_name} - Causal Impact Insights'}
   try:
@@ -85,9 +81,9 @@ def create_slide(
     [
       'PREPERIOD-END',
       (
-        datetime.datetime.strptime(request_data['event_date'], '%Y-%m-%d')
+        datetime.date.fromisoformat(request_data['event_date'])
         - datetime.timedelta(days=1)
-      ).strftime('%Y-%m-%d'),
+      ).isoformat(),
     ],
     ['POSTPERIOD-START', request_data['event_date']],
     ['POSTPERIOD-END', request_data['to_date']],